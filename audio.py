@@ -1,7 +1,10 @@
-from copy import deepcopy
+from functools import lru_cache
 from io import BytesIO
-from pydub import AudioSegment
-from synth_mapping_helper.audio_format import AudioData
+import os
+import struct
+import numpy as np
+import soundfile
+from synth_mapping_helper.audio_format import AudioData, export_ogg
 from synth_mapping_helper.synth_format import SynthFile
 import traceback
 import logging
@@ -9,35 +12,103 @@ import logging
 log = logging.getLogger(__name__)
 
 
+# Ogg page header: capture pattern, version, header type, granule position,
+# serial number, page sequence number, checksum, segment count
+_OGG_PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+# Largest possible ogg page: header + 255 segments of 255 bytes
+_OGG_MAX_PAGE_SIZE = _OGG_PAGE_HEADER.size + 255 + 255 * 255
+
+
 def get_ogg_duration(audio_path):
-    """Get audio duration in milliseconds"""
+    """
+    Get audio duration in milliseconds.
+
+    Reads the sample rate from the vorbis identification header and the sample
+    count from the granule position of the last page, without decoding any audio.
+    """
     try:
-        audio = AudioSegment.from_ogg(audio_path)
-        return len(audio)  # Duration in milliseconds
+        with open(audio_path, "rb") as f:
+            head = f.read(_OGG_MAX_PAGE_SIZE)
+            f.seek(max(0, f.seek(0, os.SEEK_END) - _OGG_MAX_PAGE_SIZE))
+            tail = f.read()
+
+        capture, _, _, _, serial, _, _, segment_count = _OGG_PAGE_HEADER.unpack_from(
+            head
+        )
+        # First packet is the vorbis identification header: packet type, "vorbis",
+        # version (4 bytes), channels (1 byte), sample rate (4 bytes)
+        packet_start = _OGG_PAGE_HEADER.size + segment_count
+        if capture != b"OggS" or not head.startswith(b"\x01vorbis", packet_start):
+            raise ValueError("Not an ogg vorbis file")
+        (sample_rate,) = struct.unpack_from("<I", head, packet_start + 12)
+
+        # The granule position of the last page of the stream is its sample count
+        page_start = tail.rfind(b"OggS", 0, len(tail) - _OGG_PAGE_HEADER.size + 1)
+        while page_start >= 0:
+            _, _, _, granule, page_serial, _, _, _ = _OGG_PAGE_HEADER.unpack_from(
+                tail, page_start
+            )
+            if page_serial == serial and granule >= 0:
+                return granule / sample_rate * 1000  # Duration in milliseconds
+            page_start = tail.rfind(b"OggS", 0, page_start)
+        raise ValueError("No final ogg page found")
     except Exception as e:
         log.error(f"Error getting audio duration: {e}")
         return None
 
 
+@lru_cache(maxsize=1)
+def _decode_ogg(raw_data: bytes) -> tuple[np.ndarray, int]:
+    """Decode ogg data to 16 bit PCM, cached so the same audio is only decoded once"""
+    pcm, sample_rate = soundfile.read(BytesIO(raw_data), dtype="int16", always_2d=True)
+    # The cached samples are shared by every caller
+    pcm.flags.writeable = False
+    return pcm, sample_rate
+
+
+def decode_source_audio(original_beatmap: SynthFile) -> tuple[np.ndarray, int]:
+    """
+    Decode the beatmap audio once so it can be sliced for every segment.
+
+    The audio was already read from the .synth archive by SMH when loading the
+    beatmap, and repeated calls for the same audio return the cached samples.
+
+    Returns:
+        Tuple of read-only 16 bit PCM samples with shape (samples, channels) and
+        the sample rate
+    """
+    return _decode_ogg(original_beatmap.audio.raw_data)
+
+
+def encode_ogg(pcm: np.ndarray, sample_rate: int) -> bytes:
+    """Encode 16 bit PCM samples with shape (samples, channels) as ogg vorbis"""
+    # SMH expects (channels, samples), the transposed view avoids copying the segment
+    return export_ogg(pcm.T, samplerate=sample_rate)
+
+
 def segment_beatmap_audio(
-    original_beatmap: SynthFile, start_time_ms, end_time_ms, beatmap_segment: SynthFile
+    source_audio: tuple[np.ndarray, int],
+    start_time_ms,
+    end_time_ms,
+    beatmap_segment: SynthFile,
 ):
     """Extract a specific segment of audio between start and end times"""
     try:
         log.info(
             f"Extracting audio segment from {start_time_ms:.2f}ms to {end_time_ms:.2f}ms..."
         )
-        original_audio_buffer = BytesIO(original_beatmap.audio.raw_data)
-        audio = AudioSegment.from_file(original_audio_buffer, format="ogg")
+        pcm, sample_rate = source_audio
 
         # Extract segment from start_time_ms to end_time_ms
-        audio_segment = audio[start_time_ms:end_time_ms]
-        segment_buffer = BytesIO()
-        audio_segment.export(segment_buffer, format="ogg")
+        start_sample = int(start_time_ms * sample_rate / 1000)
+        end_sample = int(end_time_ms * sample_rate / 1000)
+        audio_segment = pcm[start_sample:end_sample]
 
-        beatmap_segment.audio = AudioData.from_raw(segment_buffer.read())
+        beatmap_segment.audio = AudioData.from_raw(
+            encode_ogg(audio_segment, sample_rate)
+        )
         log.info(
-            f"Segmented beatmap audio: {start_time_ms} - {end_time_ms} (duration: {audio_segment.duration_seconds})"
+            f"Segmented beatmap audio: {start_time_ms} - {end_time_ms} (duration: {len(audio_segment) / sample_rate})"
         )
         return True
 
@@ -52,22 +123,22 @@ def create_tempo_segments(tempo_and_time_changes, audio_duration_ms, initial_bpm
     segments = []
 
     keys = sorted(tempo_and_time_changes.keys())
-    log.debug(f"keys: {keys}")
-    log.debug(f"tempo_and_time_changes: {tempo_and_time_changes}")
+    log.debug(
+        "keys: %s\ntempo_and_time_changes: %s\naudio_duration_ms: %s",
+        keys,
+        tempo_and_time_changes,
+        audio_duration_ms,
+    )
     last_bpm = initial_bpm
     last_tempo = None
     last_time_signature = None
-    log.debug(f"audio_duration_ms: {audio_duration_ms}")
     for i, start_time in enumerate(keys):
         events = tempo_and_time_changes[start_time]
         # Determine end time (next tempo change or end of audio)
         if i + 1 < len(keys):
-            log.debug(keys[i + 1])
             end_time = keys[i + 1]
         else:
             end_time = audio_duration_ms
-        log.debug(f"start_time: {start_time}")
-        log.debug(f"end_time: {end_time}")
 
         duration = end_time - start_time
         segment = {}
@@ -79,35 +150,40 @@ def create_tempo_segments(tempo_and_time_changes, audio_duration_ms, initial_bpm
             }
         )
         if "tempo" in events:
-            last_bpm = deepcopy(events["tempo"]["bpm"])
-            last_tempo = deepcopy(events["tempo"]["tempo"])
-            segment.update(
-                {
-                    "bpm": deepcopy(events["tempo"]["bpm"]),
-                    "tempo": deepcopy(events["tempo"]["tempo"]),
-                }
-            )
+            last_bpm = events["tempo"]["bpm"]
+            last_tempo = events["tempo"]["tempo"]
+            segment.update({"bpm": last_bpm, "tempo": last_tempo})
         else:
             segment.update({"bpm": last_bpm, "tempo": last_tempo})
         if "time_signature" in events:
-            last_time_signature = deepcopy(events["time_signature"])
+            last_time_signature = events["time_signature"].copy()
             segment.update(
                 {
                     "time_signature": {
-                        "numerator": deepcopy(events["time_signature"]["numerator"]),
-                        "denominator": deepcopy(
-                            events["time_signature"]["denominator"]
-                        ),
+                        "numerator": events["time_signature"]["numerator"],
+                        "denominator": events["time_signature"]["denominator"],
                     }
                 }
             )
         else:
-            segment.update({"time_signature": deepcopy(last_time_signature)})
-        log.debug(f"events: {events}")
-        log.debug(f"last_tempo: {last_tempo}")
-        log.debug(f"last_bpm: {last_bpm}")
-        log.debug(f"last_time_signature: {last_time_signature}")
-        log.debug(f"segment: {segment}")
+            segment.update(
+                {
+                    "time_signature": (
+                        last_time_signature.copy() if last_time_signature else None
+                    )
+                }
+            )
+        log.debug(
+            "start_time: %s\nend_time: %s\nevents: %s\nlast_tempo: %s\nlast_bpm: %s"
+            "\nlast_time_signature: %s\nsegment: %s",
+            start_time,
+            end_time,
+            events,
+            last_tempo,
+            last_bpm,
+            last_time_signature,
+            segment,
+        )
         log.info(
             f"Segment {i+1}: {segment['bpm']:.2f} BPM Time Signature {segment['time_signature']['numerator']}/{segment['time_signature']['denominator']} from {start_time:.2f}ms to {end_time:.2f}ms (duration: {duration:.2f}ms)"
         )
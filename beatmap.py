@@ -1,7 +1,6 @@
-import copy
-import math
+import dataclasses
+from itertools import compress
 import numpy as np
-from synth_mapping_helper.pattern_generation import add_spiral
 from synth_mapping_helper.synth_format import SynthFile, DataContainer
 from synth_mapping_helper.utils import second_to_beat
 import logging
@@ -9,7 +8,7 @@ import logging
 from util import beats_per_measure_from_time_signature
 
 log = logging.getLogger(__name__)
-from audio import segment_beatmap_audio
+from audio import decode_source_audio, segment_beatmap_audio
 
 
 def load_beatmap_from_synth(synth_file_path):
@@ -21,42 +20,130 @@ def load_beatmap_from_synth(synth_file_path):
         return False
 
 
-def create_tempo_segment_with_audio(beatmap: SynthFile, segment, output_path):
-    """Create a beatmap variant with specific BPM and audio segment matching the tempo duration"""
-    log.debug(f"segment: {segment}")
+def calculate_segment_timing(tempo_segments):
+    """
+    Calculate offset and note range of the beatmap for every tempo segment.
+
+    All segments are calculated together, pass the result for a single segment to
+    create_tempo_segment_with_audio.
+
+    Returns:
+        List with a dict per segment containing beats_per_measure, note_value,
+        offset_ms, start_beat and end_beat. Time signatures with less than one
+        beat per measure have no valid timing and are rejected by
+        create_tempo_segment_with_audio.
+    """
+    bpm = np.array([float(segment["bpm"]) for segment in tempo_segments])
+    start_time = np.array([segment["start_ms"] for segment in tempo_segments])
+    end_time = np.array([segment["end_ms"] for segment in tempo_segments])
+    # Get time signature
+    beats_per_measure = np.array(
+        [
+            beats_per_measure_from_time_signature(
+                {
+                    "numerator": segment["time_signature"]["numerator"],
+                    "denominator": segment["time_signature"]["denominator"],
+                }
+            )
+            for segment in tempo_segments
+        ],
+        dtype=np.int64,
+    )
+    note_value = 1 / (
+        np.array(
+            [segment["time_signature"]["denominator"] for segment in tempo_segments]
+        )
+        / 4
+    )
+
+    # Keep invalid segments from turning into divide by zero warnings
+    beats_per_measure_safe = np.maximum(beats_per_measure, 1)
+    seconds_per_measure = 60 / bpm * beats_per_measure_safe
+    # The beatmap editor requires at least 2 seconds of silence
+    silence_duration_seconds = 2
+    remainder = silence_duration_seconds % seconds_per_measure
+    time_to_next_1 = np.where(remainder == 0, 0, seconds_per_measure - remainder)
+    offset_ms = np.where(
+        start_time == 0, 0, (silence_duration_seconds + time_to_next_1) * 1000
+    )
+
+    # Convert minimum delay to beats
+    min_delay_beats = second_to_beat(silence_duration_seconds, bpm)
+    # Find the first measure boundary after min_delay_beats
+    first_measure_after_delay = (min_delay_beats // beats_per_measure_safe).astype(
+        np.int64
+    ) + 1
+    # The amount of beats until the first "1"
+    start_beat = first_measure_after_delay * beats_per_measure_safe
+
+    # Length of the segment in beats, at least one measure
+    total_beats = (
+        np.ceil(
+            np.floor(second_to_beat((end_time - start_time) / 1000, bpm))
+            / beats_per_measure_safe
+        ).astype(np.int64)
+        * beats_per_measure_safe
+    )
+    total_beats = np.maximum(total_beats, beats_per_measure_safe)
+    # Make sure the last beat falls on the last beat of a measure before the end of the segment
+    end_beat = (total_beats // beats_per_measure_safe) * beats_per_measure_safe
+    end_beat = np.where(start_time != 0, end_beat + start_beat, end_beat)
+
+    return [
+        {
+            "beats_per_measure": values[0],
+            "note_value": values[1],
+            "offset_ms": values[2],
+            "start_beat": values[3],
+            "end_beat": values[4],
+        }
+        for values in zip(
+            beats_per_measure.tolist(),
+            note_value.tolist(),
+            offset_ms.tolist(),
+            start_beat.tolist(),
+            end_beat.tolist(),
+        )
+    ]
+
+
+def create_tempo_segment_with_audio(
+    beatmap: SynthFile, segment, output_path, source_audio=None, timing=None
+):
+    """
+    Create a beatmap variant with specific BPM and audio segment matching the tempo duration.
+
+    Pass the result of decode_source_audio(beatmap) as source_audio and the entry
+    of calculate_segment_timing(segments) as timing when creating several
+    segments, so that work is only done once for all segments.
+    """
+    log.debug("segment: %s", segment)
     try:
-        # Create a deep copy of the beatmap data
-        beatmap_segment = copy.deepcopy(beatmap)
+        if timing is None:
+            timing = calculate_segment_timing([segment])[0]
+        log.debug("timing: %s", timing)
+        if timing["beats_per_measure"] < 1:
+            raise ValueError(
+                f"Time signature {segment['time_signature']} has less than one beat per measure"
+            )
+
+        # Shallow copy of the beatmap data: SMH replaces the note dicts instead of
+        # modifying them, so only the containers need to be copied. The audio is
+        # replaced by the segment audio below, so it is not copied at all.
+        beatmap_segment = dataclasses.replace(
+            beatmap,
+            bookmarks=dict(beatmap.bookmarks),
+            difficulties={
+                difficulty: dataclasses.replace(data)
+                for difficulty, data in beatmap.difficulties.items()
+            },
+        )
 
         # Update BPM and set Offset
-        bpm = float(segment["bpm"])
         start_time = segment["start_ms"]
         end_time = segment["end_ms"]
-        beatmap_segment.change_bpm(bpm)
-        seconds_per_beat = 60 / bpm
-        # Get time signature
-        beats_per_measure = beats_per_measure_from_time_signature(
-            {
-                "numerator": segment["time_signature"]["numerator"],
-                "denominator": segment["time_signature"]["denominator"],
-            }
-        )
-        note_value = 1 / (
-            segment["time_signature"]["denominator"] / 4
-            if segment["time_signature"]
-            else 1
-        )
-        seconds_per_measure = seconds_per_beat * beats_per_measure
-        # The beatmap editor requires at least 2 seconds of silence
-        silence_duration_seconds = 2
-        remainder = silence_duration_seconds % seconds_per_measure
-        if remainder == 0:
-            time_to_next_1 = 0
-        else:
-            time_to_next_1 = seconds_per_measure - remainder
-        total_offset = (
-            0 if start_time == 0 else (silence_duration_seconds + time_to_next_1) * 1000
-        )
+        beatmap_segment.change_bpm(float(segment["bpm"]))
+        total_offset = timing["offset_ms"]
         beatmap_segment.change_offset(total_offset)
 
         log.info(
@@ -64,44 +151,18 @@ def create_tempo_segment_with_audio(beatmap: SynthFile, segment, output_path):
         )
 
         # Extract the audio segment for this tempo section
-        success = segment_beatmap_audio(beatmap, start_time, end_time, beatmap_segment)
-
-        segment_length = end_time - start_time
-
-        # Convert minimum delay to beats
-        min_delay_beats = second_to_beat(2, beatmap_segment.bpm)
-        log.debug(f"min_delay_beats: {min_delay_beats}")
-
-        # Find the first measure boundary after min_delay_beats
-        first_measure_after_delay = int(min_delay_beats // beats_per_measure) + 1
-        log.debug(f"first_measure_after_delay: {first_measure_after_delay}")
-        # The amount of beats until the first "1"
-        start_beat = first_measure_after_delay * beats_per_measure
-        log.debug(f"start_beat: {start_beat}")
-
-        # Length of the segment in beats
-        total_beats = (
-            math.ceil(
-                math.floor(second_to_beat(segment_length / 1000, beatmap_segment.bpm))
-                / beats_per_measure
-            )
-            * beats_per_measure
+        if source_audio is None:
+            source_audio = decode_source_audio(beatmap)
+        success = segment_beatmap_audio(
+            source_audio, start_time, end_time, beatmap_segment
         )
-        if total_beats < beats_per_measure:
-            total_beats = beats_per_measure
-        log.debug(f"total_beats: {total_beats}")
-        # Make sure the last beat falls on the last beat of a measure before the end of the segment
-        end_beat = (total_beats // beats_per_measure) * beats_per_measure
-        if start_time != 0:
-            end_beat += start_beat
-        log.debug(f"end_beat: {end_beat}")
 
         add_timing_notes(
             beatmap_segment,
-            beats_per_measure=beats_per_measure,
-            note_value=note_value,
-            start_beat=start_beat,
-            end_beat=end_beat,
+            beats_per_measure=timing["beats_per_measure"],
+            note_value=timing["note_value"],
+            start_beat=timing["start_beat"],
+            end_beat=timing["end_beat"],
         )
 
         if not success:
@@ -172,13 +233,6 @@ def add_timing_notes(
         f"Adding {len(beat_times)} beats from Start Beat: {start_beat} || End Beat: {end_beat} @ {synth_file.bpm}"
     )
 
-    # Create base nodes with center coordinates and beat times
-    # Shape: (n_beats, 3) where columns are [x, y, time]
-    base_nodes = np.zeros((len(beat_times), 3))
-    base_nodes[:, 0] = center_x  # x coordinates
-    base_nodes[:, 1] = center_y  # y coordinates
-    base_nodes[:, 2] = beat_times  # time coordinates
-
     # Calculate fidelity based on rotations per measure (your fix)
     total_measures = len(beat_times) / beats_per_measure
     spiral_times = total_measures * rotations_per_measure
@@ -186,45 +240,45 @@ def add_timing_notes(
         len(beat_times) / spiral_times if rotations_per_measure > 0 else len(beat_times)
     )
 
-    # Generate spiral coordinates using the provided functions
-    spiral_coords = add_spiral(
-        nodes=base_nodes,
-        fidelity=fidelity,
-        radius=spiral_radius,
-        start_angle=0.0,
-        direction=1,
-    )
+    # Generate spiral coordinates around the center, one full rotation every
+    # `fidelity` notes (same positions as SMH's add_spiral, in a single pass)
+    angles = 2 * np.pi * np.arange(len(beat_times)) / fidelity
+    spiral_x = center_x + spiral_radius * np.cos(angles)
+    spiral_y = center_y + spiral_radius * np.sin(angles)
 
     # Calculate beats per full rotation for direction reversal
     beats_per_rotation = beats_per_measure / rotations_per_measure
 
-    # Add notes to appropriate hands
-    for i, beat_time in enumerate(beat_times):
-        # Determine direction based on completed rotations
-        # Every full rotation (360°), reverse direction
-        rotation_number = int((beat_time - start_beat) // beats_per_rotation)
-        direction = (
-            1 if rotation_number % 2 == 0 else -1
-        )  # Alternate direction every rotation
-
-        # If direction is reversed, flip the coordinates
-        if direction == -1:
-            # Reverse the spiral by flipping around center
-            x_pos = center_x - (spiral_coords[i, 0] - center_x)
-            y_pos = spiral_coords[i, 1]  # Keep y the same for horizontal flip
-        else:
-            x_pos = spiral_coords[i, 0]
-            y_pos = spiral_coords[i, 1]
-
-        # Determine which hand based on 2-measure intervals
-        measure_number = int((beat_time - start_beat) // hand_switch_interval)
-        is_right_hand = measure_number % 2 == 0  # Even measures = right, odd = left
-
-        # Create note coordinates (1x3 array)
-        note_coords = np.array([[x_pos, y_pos, beat_time]])
-
-        # Add to appropriate hand dictionary
-        if is_right_hand:
-            data_container.right[beat_time] = note_coords
-        else:
-            data_container.left[beat_time] = note_coords
+    # Determine direction based on completed rotations
+    # Every full rotation (360°), reverse direction
+    rotation_number = ((beat_times - start_beat) // beats_per_rotation).astype(np.int64)
+    direction = np.where(rotation_number % 2 == 0, 1, -1)
+
+    # If direction is reversed, flip the coordinates around the center
+    # (keep y the same for horizontal flip)
+    x_pos = np.where(direction == -1, 2 * center_x - spiral_x, spiral_x)
+    y_pos = spiral_y
+
+    # Determine which hand based on 2-measure intervals
+    measure_number = ((beat_times - start_beat) // hand_switch_interval).astype(
+        np.int64
+    )
+    is_right_hand = measure_number % 2 == 0  # Even measures = right, odd = left
+
+    # Create note coordinates in one contiguous (n_beats, 3) buffer
+    all_notes = np.empty((len(beat_times), 3))
+    all_notes[:, 0] = x_pos
+    all_notes[:, 1] = y_pos
+    all_notes[:, 2] = beat_times
+    # Each note is a (1x3) view into that buffer
+    note_views = all_notes[:, np.newaxis, :]
+
+    # Add to appropriate hand dictionary
+    # (create new dicts, they may be shared with the beatmap this one was copied from)
+    # The keys are converted to floats in bulk, instead of one NumPy scalar per note.
+    data_container.right = data_container.right | dict(
+        zip(beat_times[is_right_hand].tolist(), compress(note_views, is_right_hand))
+    )
+    data_container.left = data_container.left | dict(
+        zip(beat_times[~is_right_hand].tolist(), compress(note_views, ~is_right_hand))
+    )
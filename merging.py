@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 import re
 from pathlib import Path
 from typing import List, Union, Optional
@@ -11,29 +12,44 @@ from util import beats_per_measure_from_time_signature
 log = logging.getLogger(__name__)
 
 
+_SEGMENT_RE = re.compile(
+    r"(.+?)_(\d+)_BPM(\d+(?:\.\d+)?)(?:_TimeSignature(\d+)-(\d+))?_(\d+(?:\.\d+)?)s-(\d+(?:\.\d+)?)s_dur(\d+(?:\.\d+)?)s_Segment\.(.+)"
+)
+
+
 def parse_segment_filename(filename: str) -> dict:
     """
     Parse segment filename to extract metadata.
     Expected format: TheCrowing_01_BPM170_0s-228.706s_dur228.706s_Segment.synth
     """
-    pattern = r"(.+?)_(\d+)_BPM(\d+(?:\.\d+)?)(?:_TimeSignature(\d+)-(\d+))?_(\d+(?:\.\d+)?)s-(\d+(?:\.\d+)?)s_dur(\d+(?:\.\d+)?)s_Segment\.(.+)"
-    match = re.match(pattern, filename)
+    match = _SEGMENT_RE.match(filename)
 
     if not match:
         raise ValueError(f"Filename doesn't match expected pattern: {filename}")
 
+    (
+        base_name,
+        segment_number,
+        bpm,
+        numerator,
+        denominator,
+        start_time,
+        end_time,
+        duration,
+        file_extension,
+    ) = match.groups()
     result = {
-        "base_name": match.group(1),
-        "segment_number": int(match.group(2)),
-        "bpm": float(match.group(3)),
+        "base_name": base_name,
+        "segment_number": int(segment_number),
+        "bpm": float(bpm),
         "time_signature": {
-            "numerator": int(match.group(4)),
-            "denominator": int(match.group(5)),
+            "numerator": int(numerator),
+            "denominator": int(denominator),
         },
-        "start_time": float(match.group(6)),
-        "end_time": float(match.group(7)),
-        "duration": float(match.group(8)),
-        "file_extension": match.group(9),
+        "start_time": float(start_time),
+        "end_time": float(end_time),
+        "duration": float(duration),
+        "file_extension": file_extension,
     }
     return result
 
@@ -54,21 +70,20 @@ def merge_synth_segments(
     Returns:
         SynthFile: Merged beatmap file
     """
-    # Load and parse segments
-    segment_data = []
+    if not segments:
+        raise ValueError("No segments provided")
 
-    for segment in segments:
-        # Parse filename for timing info
-        filename_info = parse_segment_filename(segment.name)
-        synth_file = SynthFile.from_synth(segment)
-        segment_data.append((filename_info, synth_file))
+    # Parse filenames for timing info
+    filename_infos = [parse_segment_filename(segment.name) for segment in segments]
+
+    # Load segments in parallel, reading and unpacking the files is independent
+    with ThreadPoolExecutor(max_workers=min(8, len(segments))) as executor:
+        synth_files = list(executor.map(SynthFile.from_synth, segments))
+    segment_data = list(zip(filename_infos, synth_files))
 
     # Sort segments by start time to ensure correct order
     segment_data.sort(key=lambda x: x[0]["start_time"])
 
-    if not segment_data:
-        raise ValueError("No segments provided")
-
     base_beatmap_synth_file = SynthFile.from_synth(base_beatmap)
 
     # Create the merged file starting with the first segment
@@ -88,42 +103,28 @@ def merge_synth_segments(
                 "denominator": info["time_signature"]["denominator"],
             }
         )
-        log.debug(f"i: {i}")
+        log.debug("i: %s", i)
 
         # Calculate time offset in beats for this segment
         # Convert start time (seconds) to beats at target BPM
         start_time = info["start_time"]
         end_time = info["end_time"]
-        log.debug(f"start_time: {start_time}")
-        log.debug(f"end_time: {end_time}")
+        log.debug("start_time: %s", start_time)
+        log.debug("end_time: %s", end_time)
 
         # Offset all objects in this segment by the start time
         segment_copy.offset_everything(delta_s=start_time)
         notes = segment_copy.difficulties["Expert"]
 
-        # Collect all note positions from all note types
-        all_note_positions = []
-
-        # Add positions from right hand notes
-        if hasattr(notes, "right") and notes.right.items():
-            all_note_positions.extend(notes.right.keys())
-
-        # Add positions from left hand notes
-        if hasattr(notes, "left") and notes.left.items():
-            all_note_positions.extend(notes.left.keys())
-
-        # Add positions from single notes
-        if hasattr(notes, "single") and notes.single.items():
-            all_note_positions.extend(notes.single.keys())
-
-        # Add positions from both hand notes
-        if hasattr(notes, "both") and notes.both.items():
-            all_note_positions.extend(notes.both.keys())
+        # Note types that contain any notes
+        note_dicts = [
+            d for d in (notes.right, notes.left, notes.single, notes.both) if d
+        ]
 
         # Find first and last note positions across all note types
-        if all_note_positions:
-            first = min(all_note_positions)
-            last = max(all_note_positions)
+        if note_dicts:
+            first = min(min(d) for d in note_dicts)
+            last = max(max(d) for d in note_dicts)
             total_notes = last - first
         else:
             # Handle case where no notes exist
@@ -135,9 +136,9 @@ def merge_synth_segments(
         segment_copy.bookmarks[first] = (
             f"{segment_copy.bpm} BPM || Time Signature {beats_per_measure}/{4}"
         )
-        log.debug(f"first note after start time offset: {first}")
-        log.debug(f"last note after start time offset: {last}")
-        log.debug(f"total notes: {total_notes}")
+        log.debug("first note after start time offset: %s", first)
+        log.debug("last note after start time offset: %s", last)
+        log.debug("total notes: %s", total_notes)
 
         # Merge the offset segment into the main file
         merged_file.merge(segment_copy, adjust_bpm=True)
@@ -1,79 +1,101 @@
 import logging
-from typing import Any, Dict, List
+import os
+import struct
+from typing import NamedTuple, Tuple, Union
 import mido
+import numpy as np
 import logging
 
 log = logging.getLogger(__name__)
 
 
-def calculate_time_from_ticks(
-    target_ticks: int,
-    ticks_per_beat: int,
-    tempo_events: List[Dict],
-    initial_tempo: int = 500000,
-) -> float:
+# Tempo and time signature events with their absolute tick position
+TEMPO_DTYPE = np.dtype([("time_ticks", "i8"), ("tempo", "i4"), ("track", "i4")])
+TIME_SIGNATURE_DTYPE = np.dtype(
+    [
+        ("time_ticks", "i8"),
+        ("time_ms", "f8"),
+        ("numerator", "i4"),
+        ("denominator", "i4"),
+        ("clocks_per_click", "i4"),
+        ("notated_32nd_notes_per_beat", "i4"),
+        ("track", "i4"),
+    ]
+)
+
+
+class TempoMap(NamedTuple):
+    """Elapsed time at every tempo change, for converting ticks to seconds"""
+
+    boundary_ticks: np.ndarray
+    seconds_per_tick: np.ndarray
+    time_at_boundary: np.ndarray
+
+
+def build_tempo_map(
+    tempo_events: np.ndarray, ticks_per_beat: int, initial_tempo: int = 500000
+) -> TempoMap:
     """
-    Convert ticks to time in seconds using tempo changes.
+    Precompute the time in seconds at every tempo change.
 
     Args:
-        target_ticks: The tick position to convert to time
+        tempo_events: Tempo events (TEMPO_DTYPE) sorted by time_ticks
         ticks_per_beat: MIDI file's ticks per beat
-        tempo_events: List of tempo events sorted by time_ticks
         initial_tempo: Default tempo in microseconds per beat (500000 = 120 BPM)
 
     Returns:
-        Time in seconds
+        TempoMap starting at tick 0 with the initial tempo
     """
-    if target_ticks == 0:
-        return 0.0
-
-    current_time_seconds = 0.0
-    current_tempo = initial_tempo
-    last_tick_position = 0
-
-    # Process each tempo change up to our target tick position
-    for tempo_event in tempo_events:
-        tempo_change_tick = tempo_event["time_ticks"]
-
-        # If this tempo change is after our target, calculate remaining time and break
-        if tempo_change_tick >= target_ticks:
-            remaining_ticks = target_ticks - last_tick_position
-            if remaining_ticks > 0:
-                current_time_seconds += mido.tick2second(
-                    remaining_ticks, ticks_per_beat, current_tempo
-                )
-            break
+    boundary_ticks = np.concatenate(([0], tempo_events["time_ticks"]))
+    seconds_per_tick = (
+        np.concatenate(([initial_tempo], tempo_events["tempo"])) * 1e-6 / ticks_per_beat
+    )
+    time_at_boundary = np.concatenate(
+        ([0.0], np.cumsum(np.diff(boundary_ticks) * seconds_per_tick[:-1]))
+    )
+    return TempoMap(boundary_ticks, seconds_per_tick, time_at_boundary)
 
-        # Calculate time from last position to this tempo change
-        if tempo_change_tick > last_tick_position:
-            ticks_in_segment = tempo_change_tick - last_tick_position
-            current_time_seconds += mido.tick2second(
-                ticks_in_segment, ticks_per_beat, current_tempo
-            )
 
-        # Update tempo and position
-        current_tempo = tempo_event["tempo"]
-        last_tick_position = tempo_change_tick
-    else:
-        # No tempo change after target_ticks, calculate remaining time with current tempo
-        remaining_ticks = target_ticks - last_tick_position
-        if remaining_ticks > 0:
-            current_time_seconds += mido.tick2second(
-                remaining_ticks, ticks_per_beat, current_tempo
-            )
+def calculate_time_from_ticks(
+    target_ticks: np.ndarray, tempo_map: TempoMap
+) -> np.ndarray:
+    """
+    Convert ticks to time in seconds using tempo changes.
+
+    Args:
+        target_ticks: The tick positions to convert to time
+        tempo_map: Tempo changes of the MIDI file, see build_tempo_map
 
-    return current_time_seconds
+    Returns:
+        Time in seconds for each target tick
+    """
+    target_ticks = np.asarray(target_ticks, dtype=np.int64)
+    # Last tempo change at or before each target
+    idx = np.searchsorted(tempo_map.boundary_ticks, target_ticks, side="right") - 1
+    return (
+        tempo_map.time_at_boundary[idx]
+        + (target_ticks - tempo_map.boundary_ticks[idx])
+        * tempo_map.seconds_per_tick[idx]
+    )
 
 
-def extract_tempo_changes(midi_file: mido.MidiFile):
-    log.debug("Start extract_tempo_changes")
+def extract_meta_events(midi_file: mido.MidiFile) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Collect tempo and time signature events of all tracks in a single pass.
+
+    Returns:
+        Tuple of (tempo events as TEMPO_DTYPE, time signature events as
+        TIME_SIGNATURE_DTYPE without time_ms), both sorted by time_ticks
+    """
+    log.debug("Start extract_meta_events")
     ticks_per_beat = midi_file.ticks_per_beat
 
     log.info(f"Processing MIDI file: {midi_file}")
     log.info(f"Ticks per beat: {ticks_per_beat}")
 
-    # Process all tracks and collect tempo events with absolute timing
-    all_tempo_events = []
+    # Process all tracks and collect meta events with absolute timing
+    tempo_events = []
+    time_sig_events = []
     try:
         for track_idx, track in enumerate(midi_file.tracks):
             current_time_ticks = 0
@@ -82,112 +104,233 @@ def extract_tempo_changes(midi_file: mido.MidiFile):
                 current_time_ticks += msg.time
 
                 if msg.type == "set_tempo":
-                    all_tempo_events.append(
-                        {
-                            "time_ticks": current_time_ticks,
-                            "tempo": msg.tempo,
-                            "track": track_idx,
-                        }
+                    tempo_events.append((current_time_ticks, msg.tempo, track_idx))
+                elif msg.type == "time_signature":
+                    time_sig_events.append(
+                        (
+                            current_time_ticks,
+                            0.0,
+                            msg.numerator,
+                            msg.denominator,
+                            msg.clocks_per_click,
+                            msg.notated_32nd_notes_per_beat,
+                            track_idx,
+                        )
                     )
     except Exception as e:
         logging.exception(e)
 
-    # Sort all tempo events by time
-    all_tempo_events.sort(key=lambda x: x["time_ticks"])
-    return all_tempo_events
+    return _sorted_meta_events(tempo_events, time_sig_events)
+
+
+def _sorted_meta_events(tempo_events, time_sig_events) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert collected tempo and time signature tuples to arrays sorted by time"""
+    # Sort all events by time, keeping track order for events at the same tick.
+    # The events of each track are already in order, which the stable sort exploits.
+    tempo_events = np.array(tempo_events, dtype=TEMPO_DTYPE)
+    tempo_events = tempo_events[np.argsort(tempo_events["time_ticks"], kind="stable")]
+    time_sig_events = np.array(time_sig_events, dtype=TIME_SIGNATURE_DTYPE)
+    time_sig_events = time_sig_events[
+        np.argsort(time_sig_events["time_ticks"], kind="stable")
+    ]
+    return tempo_events, time_sig_events
+
+
+# Data bytes following the status byte of channel messages (by high nibble) and
+# system messages, which can be skipped without decoding
+_CHANNEL_DATA_LENGTH = {0x8: 2, 0x9: 2, 0xA: 2, 0xB: 2, 0xC: 1, 0xD: 1, 0xE: 2}
+_SYSTEM_DATA_LENGTH = {0xF1: 1, 0xF2: 2, 0xF3: 1, 0xF6: 0} | {
+    status: 0 for status in range(0xF8, 0xFF)
+}
+_META_SET_TEMPO = 0x51
+_META_TIME_SIGNATURE = 0x58
+_CHUNK_HEADER = struct.Struct(">4sL")
+_FILE_HEADER = struct.Struct(">hhh")
+
+
+def _read_variable_int(data: bytes, pos: int) -> Tuple[int, int]:
+    """Read a variable length quantity, returns the value and the position after it"""
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def read_meta_events(
+    midi_path: Union[str, os.PathLike],
+) -> Tuple[int, np.ndarray, np.ndarray]:
+    """
+    Read only the tempo and time signature events of a MIDI file.
 
+    Unlike mido.MidiFile, no message objects are created, all other events are
+    skipped over in the raw track data.
 
-def extract_time_signature_changes(
-    midi_file: mido.MidiFile, tempo_events: List[Dict], initial_tempo: int
-) -> List[Dict[str, Any]]:
-    """Extract all time signature changes from the MIDI file."""
-    time_sig_changes = []
-
-    log.info("Extracting Tempo")
+    Returns:
+        Tuple of (ticks per beat, tempo events, time signature events), the events
+        as returned by extract_meta_events
+    """
+    log.debug("Start read_meta_events")
+    with open(midi_path, "rb") as f:
+        data = f.read()
+
+    name, size = _CHUNK_HEADER.unpack_from(data)
+    if name != b"MThd":
+        raise OSError("MThd not found. Probably not a MIDI file")
+    _, num_tracks, ticks_per_beat = _FILE_HEADER.unpack_from(data, _CHUNK_HEADER.size)
+    pos = _CHUNK_HEADER.size + size
+
+    log.info("Processing MIDI file: %s", midi_path)
+    log.info("Ticks per beat: %s", ticks_per_beat)
+
+    tempo_events = []
+    time_sig_events = []
+    for track_idx in range(num_tracks):
+        name, size = _CHUNK_HEADER.unpack_from(data, pos)
+        if name != b"MTrk":
+            raise OSError("no MTrk header at start of track")
+        pos += _CHUNK_HEADER.size
+        end = pos + size
+
+        current_time_ticks = 0
+        last_status = None
+        while pos < end:
+            delta, pos = _read_variable_int(data, pos)
+            current_time_ticks += delta
+
+            status = data[pos]
+            if status < 0x80:
+                # Running status, this byte is already the first data byte
+                if last_status is None:
+                    raise OSError("running status without last_status")
+                status = last_status
+            else:
+                pos += 1
+                if status != 0xFF:
+                    # Meta messages don't set running status
+                    last_status = status
+
+            if status == 0xFF:
+                meta_type = data[pos]
+                length, pos = _read_variable_int(data, pos + 1)
+                if meta_type == _META_SET_TEMPO and length >= 3:
+                    tempo_events.append(
+                        (
+                            current_time_ticks,
+                            int.from_bytes(data[pos : pos + 3], "big"),
+                            track_idx,
+                        )
+                    )
+                elif meta_type == _META_TIME_SIGNATURE and length >= 4:
+                    time_sig_events.append(
+                        (
+                            current_time_ticks,
+                            0.0,
+                            data[pos],
+                            2 ** data[pos + 1],
+                            data[pos + 2],
+                            data[pos + 3],
+                            track_idx,
+                        )
+                    )
+                pos += length
+            elif status in (0xF0, 0xF7):
+                length, pos = _read_variable_int(data, pos)
+                pos += length
+            elif status < 0xF0:
+                pos += _CHANNEL_DATA_LENGTH[status >> 4]
+            elif status in _SYSTEM_DATA_LENGTH:
+                pos += _SYSTEM_DATA_LENGTH[status]
+            else:
+                raise OSError(f"undefined status byte 0x{status:02x}")
+        pos = end
+
+    tempo_events, time_sig_events = _sorted_meta_events(tempo_events, time_sig_events)
+    return ticks_per_beat, tempo_events, time_sig_events
 
-    for track_num, track in enumerate(midi_file.tracks):
-        track_time = 0
 
-        for msg in track:
-            track_time += msg.time
+def extract_time_signature_changes(
+    time_sig_events: np.ndarray, tempo_map: TempoMap
+) -> np.ndarray:
+    """Fill in time_ms of the time signature events collected by extract_meta_events."""
+    log.info("Extracting Tempo")
 
-            if msg.type == "time_signature":
-                absolute_time = calculate_time_from_ticks(
-                    track_time, midi_file.ticks_per_beat, tempo_events, initial_tempo
-                )
-                time_sig_changes.append(
-                    {
-                        "numerator": msg.numerator,
-                        "denominator": msg.denominator,
-                        "time_ticks": track_time,
-                        "time_ms": absolute_time * 1000,
-                        "clocks_per_click": msg.clocks_per_click,
-                        "notated_32nd_notes_per_beat": msg.notated_32nd_notes_per_beat,
-                        "track": track_num,
-                    }
-                )
+    # Convert all time signature positions in one go
+    time_sig_changes = time_sig_events.copy()
+    time_sig_changes["time_ms"] = (
+        calculate_time_from_ticks(time_sig_changes["time_ticks"], tempo_map) * 1000
+    )
     log.debug(time_sig_changes)
-    time_sig_changes.sort(key=lambda x: x["time_ms"])
     return time_sig_changes
 
 
-def extract_tempo_and_time_signature_changes(midi_file: mido.MidiFile, bpm: float):
-    """Extract tempo changes with timing in milliseconds from MIDI file"""
+def extract_tempo_and_time_signature_changes(
+    midi_file: Union[mido.MidiFile, str, os.PathLike], bpm: float
+):
+    """
+    Extract tempo changes with timing in milliseconds from MIDI file
+
+    midi_file is either a loaded mido.MidiFile or the path of the MIDI file, which
+    is then read with read_meta_events without loading any other events.
+    """
     try:
         time_changes = {}
-        ticks_per_beat = midi_file.ticks_per_beat
-        all_tempo_events = extract_tempo_changes(midi_file)
+        if isinstance(midi_file, mido.MidiFile):
+            ticks_per_beat = midi_file.ticks_per_beat
+            all_tempo_events, time_sig_events = extract_meta_events(midi_file)
+        else:
+            ticks_per_beat, all_tempo_events, time_sig_events = read_meta_events(
+                midi_file
+            )
 
         # Convert to milliseconds and create final tempo changes list
-        current_time_ms = 0.0
         current_tempo = 60000000 / bpm
-        last_time_ticks = 0
+        tempo_map = build_tempo_map(all_tempo_events, ticks_per_beat, current_tempo)
+        # Time of every tempo change, the first boundary is the start of the file
+        tempo_event_times_ms = (tempo_map.time_at_boundary[1:] * 1000).tolist()
 
         # Add initial tempo if no tempo change at start
-        if not all_tempo_events or all_tempo_events[0]["time_ticks"] > 0:
+        if len(all_tempo_events) == 0 or all_tempo_events[0]["time_ticks"] > 0:
             bpm = mido.tempo2bpm(current_tempo)
             time_changes[0.0] = {
                 "tempo": {"time_ms": 0.0, "bpm": round(bpm, 2), "tempo": current_tempo}
             }
 
-        for event in all_tempo_events:
-            log.debug(f"current_time_ms: {current_time_ms}")
-            # Calculate time in ms up to this tempo change
-            if event["time_ticks"] > last_time_ticks:
-                delta_ticks = event["time_ticks"] - last_time_ticks
-                delta_ms = (
-                    mido.tick2second(delta_ticks, ticks_per_beat, current_tempo) * 1000
-                )
-                current_time_ms += delta_ms
+        for tempo, current_time_ms in zip(
+            all_tempo_events["tempo"].tolist(), tempo_event_times_ms
+        ):
+            log.debug("current_time_ms: %s", current_time_ms)
 
             # Only add if tempo actually changed
-            if current_tempo != event["tempo"]:
-                current_tempo = event["tempo"]
-                bpm = mido.tempo2bpm(event["tempo"])
+            if current_tempo != tempo:
+                current_tempo = tempo
+                bpm = mido.tempo2bpm(tempo)
                 key = round(current_time_ms, 3)
                 if key not in time_changes:
                     time_changes[key] = {}
                 time_changes[key]["tempo"] = {
                     "time_ms": current_time_ms,
                     "bpm": round(bpm, 2),
-                    "tempo": event["tempo"],
+                    "tempo": tempo,
                 }
                 log.info(
                     f"Found tempo change: {bpm:.2f} BPM at {current_time_ms:.2f}ms"
                 )
 
-            last_time_ticks = event["time_ticks"]
-
-        time_sig_changes = extract_time_signature_changes(
-            midi_file, all_tempo_events, int(current_tempo)
-        )
-        for time_sig_change in time_sig_changes:
-            key = round(time_sig_change["time_ms"], 3)
+        time_sig_changes = extract_time_signature_changes(time_sig_events, tempo_map)
+        for time_ms, numerator, denominator in zip(
+            time_sig_changes["time_ms"].tolist(),
+            time_sig_changes["numerator"].tolist(),
+            time_sig_changes["denominator"].tolist(),
+        ):
+            key = round(time_ms, 3)
             if key not in time_changes:
                 time_changes[key] = {}
             time_changes[key]["time_signature"] = {
-                "numerator": time_sig_change["numerator"],
-                "denominator": time_sig_change["denominator"],
+                "numerator": numerator,
+                "denominator": denominator,
             }
         log.debug(time_changes)
         log.info(f"Found {len(time_changes)} unique tempo changes")
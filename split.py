@@ -1,15 +1,44 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 from pathlib import Path
+import sys
 
-from mido import MidiFile
+import numpy as np
 import progressbar
 
-from audio import create_tempo_segments
-from beatmap import create_tempo_segment_with_audio, load_beatmap_from_synth
+from audio import create_tempo_segments, decode_source_audio
+from beatmap import (
+    calculate_segment_timing,
+    create_tempo_segment_with_audio,
+    load_beatmap_from_synth,
+)
 from midi import extract_tempo_and_time_signature_changes
-from util import generate_segment_filename, validate_inputs
+from util import format_seconds, generate_segment_filename, validate_inputs
 import logging
 
+# Set in each worker process by _init, so they are only sent to every worker once
+_worker_beatmap = None
+_worker_source_audio = None
+
+
+def _init(beatmap, source_audio):
+    """Store the base beatmap and decoded source audio in a worker process"""
+    global _worker_beatmap, _worker_source_audio
+    _worker_beatmap = beatmap
+    _worker_source_audio = source_audio
+
+
+def _work(segment, output_path, timing):
+    """Create a single segment in a worker process"""
+    return create_tempo_segment_with_audio(
+        _worker_beatmap,
+        segment,
+        output_path,
+        _worker_source_audio,
+        timing,
+    )
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -53,9 +82,9 @@ Examples:
 
     # Extract tempo changes from MIDI
     log.info("Extracting tempo changes from MIDI file...")
-    midi_file = MidiFile(args.midi)
+    # Only tempo and time signature events are read, notes are skipped
     tempo_and_time_changes = extract_tempo_and_time_signature_changes(
-        midi_file, beatmap.bpm
+        args.midi, beatmap.bpm
     )
 
     if not tempo_and_time_changes:
@@ -69,7 +98,7 @@ Examples:
         log.error("Error: Could not determine audio duration")
         return 1
 
-    log.info(f"Source audio duration: {audio_duration_ms/1000.0:.2f} seconds")
+    log.info("Source audio duration: %.2f seconds", audio_duration_ms / 1000.0)
 
     # Create tempo segments
     log.info("\nCreating tempo segments...")
@@ -83,75 +112,138 @@ Examples:
 
     original_bpm = beatmap.bpm
     log.info(
-        f"Base beatmap loaded: '{beatmap.meta.name}' by {beatmap.meta.artist}, mapped by {beatmap.meta.mapper}"
+        "Base beatmap loaded: '%s' by %s, mapped by %s",
+        beatmap.meta.name,
+        beatmap.meta.artist,
+        beatmap.meta.mapper,
     )
-    log.info(f"Original BPM: {original_bpm}, Offset: {beatmap.offset_ms}")
+    log.info("Original BPM: %s, Offset: %s", original_bpm, beatmap.offset_ms)
 
     # Generate variants with audio segments
     successful_variants = 0
     failed_variants = 0
-    source_filename = Path(args.source).name
+    source_path = Path(args.source)
+    stem = source_path.stem
+    suffix = source_path.suffix
+
+    # Decode the source audio once, every segment is sliced from it
+    source_audio = decode_source_audio(beatmap)
+    # Offsets and note ranges of all segments in one go
+    segment_timings = calculate_segment_timing(tempo_segments)
 
     log.info(
-        f"\nGenerating {len(tempo_segments)} beatmap variants with tempo-matched audio segments..."
+        "\nGenerating %d beatmap variants with tempo-matched audio segments...",
+        len(tempo_segments),
     )
 
-    bar = progressbar.ProgressBar(max_value=len(tempo_segments))
-    for i, segment in enumerate(tempo_segments):
-        target_segment = segment
+    # Segment times in seconds, converted for all segments at once
+    segment_count = len(tempo_segments)
+    starts_sec, ends_sec, durations_sec = (
+        (
+            np.fromiter(
+                (segment[key] for segment in tempo_segments),
+                dtype=np.float64,
+                count=segment_count,
+            )
+            / 1000.0
+        ).tolist()
+        for key in ("start_ms", "end_ms", "duration_ms")
+    )
 
-        output_filename = generate_segment_filename(
-            source_filename,
-            i,
-            len(tempo_segments),
-            segment,
+    # Determine number of digits needed for zero-padding
+    digits = len(str(segment_count))
+    output_filenames = [
+        generate_segment_filename(
+            stem,
+            suffix,
+            f"{i + 1:0{digits}d}",
+            # Remove decimal if the BPM is a whole number
+            f"{segment['bpm']:g}",
+            (
+                f"_TimeSignature{segment['time_signature']['numerator']}-{segment['time_signature']['denominator']}"
+                if "time_signature" in segment
+                else ""
+            ),
+            format_seconds(start_sec),
+            format_seconds(end_sec),
+            format_seconds(duration_sec),
         )
-        output_path = output_dir / output_filename
-
-        duration_sec = segment["duration_ms"] / 1000.0
-        log.info(
-            f"Creating segment {i+1}/{len(tempo_segments)}: {output_filename} (duration: {duration_sec:.2f}s)"
+        for i, (segment, start_sec, end_sec, duration_sec) in enumerate(
+            zip(tempo_segments, starts_sec, ends_sec, durations_sec)
         )
+    ]
+
+    # Segments are independent, create them in parallel. The results are
+    # collected by index so they can be reported in order afterwards.
+    results = {}
+    # Only draw the progress bar on a terminal, not when the output is redirected
+    progress_bar_class = (
+        progressbar.ProgressBar if sys.stderr.isatty() else progressbar.NullBar
+    )
+    bar = progress_bar_class(max_value=len(tempo_segments))
+    with ProcessPoolExecutor(
+        max_workers=min(os.cpu_count() or 1, len(tempo_segments)),
+        initializer=_init,
+        initargs=(beatmap, source_audio),
+    ) as executor:
+        futures = {
+            executor.submit(
+                _work, segment, output_dir / output_filenames[i], segment_timings[i]
+            ): i
+            for i, segment in enumerate(tempo_segments)
+        }
+        for completed, future in enumerate(as_completed(futures)):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                log.error("Error creating segment %d: %s", i + 1, e)
+                results[i] = False
+            bar.update(completed)
+    bar.finish()
 
-        success = create_tempo_segment_with_audio(
-            beatmap,
-            target_segment,
-            output_path,
+    for i, (output_filename, duration_sec) in enumerate(
+        zip(output_filenames, durations_sec)
+    ):
+        log.info(
+            "Created segment %d/%d: %s (duration: %.2fs)",
+            i + 1,
+            len(tempo_segments),
+            output_filename,
+            duration_sec,
         )
 
-        if success:
+        if results[i]:
             successful_variants += 1
         else:
             failed_variants += 1
-            log.error(f"Failed to create segment {i+1}: {output_filename}")
-
-        bar.update(i)
-    bar.finish()
+            log.error("Failed to create segment %d: %s", i + 1, output_filename)
 
     # Summary
-    log.info(f"\n{'='*60}")
-    log.info(f"SUMMARY")
-    log.info(f"{'='*60}")
-    log.info(f"Total tempo changes found: {len(tempo_and_time_changes)}")
-    log.info(f"Tempo segments created: {len(tempo_segments)}")
-    log.info(f"Segments after filtering: {len(tempo_segments)}")
-    log.info(f"Successful variants created: {successful_variants}")
-    log.info(f"Failed variants: {failed_variants}")
-    log.info(f"Output directory: {output_dir}")
+    log.info("\n%s", "=" * 60)
+    log.info("SUMMARY")
+    log.info("=" * 60)
+    log.info("Total tempo changes found: %d", len(tempo_and_time_changes))
+    log.info("Tempo segments created: %d", len(tempo_segments))
+    log.info("Segments after filtering: %d", len(tempo_segments))
+    log.info("Successful variants created: %d", successful_variants)
+    log.info("Failed variants: %d", failed_variants)
+    log.info("Output directory: %s", output_dir)
 
     if successful_variants > 0:
-        log.info(f"\n📁 Each variant contains:")
-        log.info(f"   • Beatmap metadata with Offset = 0.0")
-        log.info(f"   • Audio segment matching the tempo duration")
-        log.info(f"   • Only audio that corresponds to the specific tempo section")
+        log.info("\n📁 Each variant contains:")
+        log.info("   • Beatmap metadata with Offset = 0.0")
+        log.info("   • Audio segment matching the tempo duration")
+        log.info("   • Only audio that corresponds to the specific tempo section")
 
     if failed_variants > 0:
         log.error(
-            f"\n⚠️  {failed_variants} variants failed to create. Check the error messages above."
+            "\n⚠️  %d variants failed to create. Check the error messages above.",
+            failed_variants,
         )
         return 1
     else:
-        log.info(f"\n✅ All variants created successfully!")
+        log.info("\n✅ All variants created successfully!")
         return 0
 
 
@@ -1,38 +1,50 @@
+from functools import lru_cache
 import os
 from pathlib import Path
 import logging
 
 log = logging.getLogger(__name__)
 
+_MIDI_SUFFIXES = {".mid", ".midi"}
+_SYNTH_SUFFIXES = {".synth"}
+
 
 def validate_inputs(midi_file, source_synth, output_dir):
-    """Validate all input parameters and create necessary directories"""
-    errors = []
+    """
+    Validate all input parameters and create necessary directories
 
+    Stops at the first error, the output directory is only created for valid inputs.
+    """
     # Check MIDI file
-    if not os.path.exists(midi_file):
-        errors.append(f"MIDI file '{midi_file}' does not exist.")
-    elif not midi_file.lower().endswith((".mid", ".midi")):
-        errors.append(f"File '{midi_file}' does not appear to be a MIDI file.")
+    midi_path = Path(midi_file)
+    try:
+        midi_path.stat()
+    except OSError:
+        log.error("Error: MIDI file '%s' does not exist.", midi_file)
+        return False
+    if midi_path.suffix.lower() not in _MIDI_SUFFIXES:
+        log.error("Error: File '%s' does not appear to be a MIDI file.", midi_file)
+        return False
 
     # Check source synth file
-    if not os.path.exists(source_synth):
-        errors.append(f"Source beatmap file '{source_synth}' does not exist.")
-    elif not source_synth.lower().endswith(".synth"):
-        errors.append(
-            f"Source file '{source_synth}' does not appear to be a .synth file."
+    source_path = Path(source_synth)
+    try:
+        source_path.stat()
+    except OSError:
+        log.error("Error: Source beatmap file '%s' does not exist.", source_synth)
+        return False
+    if source_path.suffix.lower() not in _SYNTH_SUFFIXES:
+        log.error(
+            "Error: Source file '%s' does not appear to be a .synth file.",
+            source_synth,
         )
+        return False
 
     # Validate output directory path
-    output_path = Path(output_dir)
     try:
-        output_path.mkdir(parents=True, exist_ok=True)
-    except (PermissionError, OSError) as e:
-        errors.append(f"Cannot create output directory '{output_dir}': {e}")
-
-    if errors:
-        for error in errors:
-            log.error(f"Error: {error}")
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        log.error("Error: Cannot create output directory '%s': %s", output_dir, e)
         return False
 
     return True
@@ -41,42 +53,60 @@ def validate_inputs(midi_file, source_synth, output_dir):
 def find_ogg_file_in_synth(temp_dir):
     """Find the ogg file in the extracted .synth directory"""
 
-    for root, dirs, files in os.walk(temp_dir):
-        for file in files:
-            if any(file.lower().endswith("ogg")):
-                return os.path.join(root, file)
+    # Depth first search that stops at the first match
+    directories = [temp_dir]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(".ogg"):
+                    return entry.path
+                elif entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
 
     return None
 
 
-def generate_segment_filename(base_path, index, total_count, segment):
-    """Generate output filename for tempo segments"""
-    base_path = Path(base_path)
-    stem = base_path.stem
-    suffix = base_path.suffix
-
-    # Determine number of digits needed for zero-padding
-    digits = len(str(total_count))
-    sequence_num = str(index + 1).zfill(digits)
-
-    # Format BPM (remove decimal if it's a whole number)
-    bpm_str = f"{segment['bpm']:g}"
-
-    # Format start and end times in seconds
-    start_sec = segment["start_ms"] / 1000.0
-    end_sec = segment["end_ms"] / 1000.0
-    duration_sec = segment["duration_ms"] / 1000.0
-
-    start_str = f"{start_sec:.3f}".rstrip("0").rstrip(".")
-    end_str = f"{end_sec:.3f}".rstrip("0").rstrip(".")
-    duration_str = f"{duration_sec:.3f}".rstrip("0").rstrip(".")
-
-    time_sig_str = ""
-
-    if "time_signature" in segment:
-        time_sig_str = f"_TimeSignature{segment['time_signature']['numerator']}-{segment['time_signature']['denominator']}"
-
-    return f"{stem}_{sequence_num}_BPM{bpm_str}{time_sig_str}_{start_str}s-{end_str}s_dur{duration_str}s_Segment{suffix}"
+def format_seconds(x):
+    """Format a number with up to 3 decimals, without trailing zeros"""
+    s = f"{x:.3f}"
+    i = len(s)
+    while s[i - 1] == "0":
+        i -= 1
+    if s[i - 1] == ".":
+        i -= 1
+    return s[:i]
+
+
+def generate_segment_filename(
+    stem,
+    suffix,
+    sequence_num_str,
+    bpm_str,
+    time_sig_str,
+    start_str,
+    end_str,
+    duration_str,
+):
+    """
+    Generate output filename for tempo segments
+
+    All parts are already formatted by the caller, times in seconds are formatted
+    with format_seconds and time_sig_str is either empty or "_TimeSignature4-4".
+    """
+    return f"{stem}_{sequence_num_str}_BPM{bpm_str}{time_sig_str}_{start_str}s-{end_str}s_dur{duration_str}s_Segment{suffix}"
+
+
+@lru_cache(maxsize=64)
+def _beats_per_measure(numerator, denominator):
+    """Beats per measure of a time signature, cached per time signature"""
+    note_value = denominator / 4
+    beats_per_measure = int(numerator / note_value)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("numerator: %s", numerator)
+        log.debug("denominator: %s", denominator)
+        log.debug("note_value: %s", note_value)
+        log.debug("beats_per_measure: %s", beats_per_measure)
+    return beats_per_measure
 
 
 def beats_per_measure_from_time_signature(time_signature):
@@ -85,10 +115,4 @@ def beats_per_measure_from_time_signature(time_signature):
     denominator = (
         time_signature["denominator"] if "denominator" in time_signature else 4
     )
-    note_value = denominator / 4
-    beats_per_measure = int(numerator / note_value)
-    log.debug(f"numerator: {numerator}")
-    log.debug(f"denominator: {denominator}")
-    log.debug(f"note_value: {note_value}")
-    log.debug(f"beats_per_measure: {beats_per_measure}")
-    return beats_per_measure
+    return _beats_per_measure(numerator, denominator)